@@ -1,10 +1,17 @@
 from collections import OrderedDict
-import xml.etree.ElementTree as ET 
-from xml.dom import minidom 
-import math
-import sys 
+from operator import itemgetter
+import xml.etree.ElementTree as ET
+import copy
+import sys
 import logging
 
+# lxml's C serializer is noticeably faster than ElementTree's for very large
+# scores, but it's optional - the stdlib path below works fine without it
+try:
+	from lxml import etree as LET
+except ImportError:
+	LET = None
+
 """
 ..module:: mmp_to_musicxml-documentation
 """
@@ -119,19 +126,120 @@ class MMP_MusicXML_Converter:
 		3: "64th"
 	}
 
-	# properties for clef types 
+	# the longest length that has its own note type (a whole note);
+	# anything longer is also treated as a whole note
+	MAX_NOTE_LENGTH = 192
+
+	# lookup tables built once at class definition time so finding the
+	# closest note type (or its duration text) for a length is just an
+	# array index instead of a sort + linear scan on every note.
+	# LENGTH_TO_TYPE[length] is the closest note type whose length is <= length,
+	# and LENGTH_TO_DURATION[length] is that type's duration text (assuming divisions = 8)
+	LENGTH_TO_TYPE = []
+	LENGTH_TO_DURATION = []
+	for _length in range(MAX_NOTE_LENGTH + 1):
+		_closest = "64th" # lengths smaller than a 64th note fall back to a 64th
+		for _note_length in sorted(NOTE_LENGTHS, reverse=True):
+			if _note_length <= _length:
+				_closest = NOTE_LENGTHS[_note_length]
+				break
+		LENGTH_TO_TYPE.append(_closest)
+		LENGTH_TO_DURATION.append(str(int(NOTE_TYPE[_closest] / 6)))
+	del _length, _note_length, _closest
+
+	# properties for clef types
 	CLEF_TYPE = {
 		"treble": {"sign": "G", 'line': "2"}, 
 		"bass": {"sign": "F", "line": "4"}
 	}
 
-	# default values for time signature (4/4) 
+	# default values for time signature (4/4)
 	TIME_SIGNATURE_NUMERATOR = "4"
 	TIME_SIGNATURE_DENOMINATOR = "4"
+
+	# building a note out of individual SubElement calls costs ~8 element
+	# allocations per note, which adds up in the hot path. instead format one
+	# of these templates and parse it in a single ET.fromstring call.
+	# chord_block and alter_block are either "" or a fixed fragment.
+	NOTE_TEMPLATE = "<note>{chord_block}{pitch_block}<duration>{duration}</duration><type>{type}</type></note>"
+	PITCH_TEMPLATE = "<pitch><step>{step}</step>{alter_block}<octave>{octave}</octave></pitch>"
+	REST_TEMPLATE = "<note><rest /><duration>{duration}</duration><type>{type}</type></note>"
+
+	# a note's pitch block (step/alter/octave) depends only on its key, and
+	# keys are bounded, so fill in PITCH_TEMPLATE for all 128 piano key
+	# numbers up front - add_note then just indexes by key instead of doing
+	# the modulo, sharp check, and octave division per note
+	PITCH_BLOCK = []
+	for _key in range(128):
+		_pitch = NOTES[_key % 12]
+		PITCH_BLOCK.append(PITCH_TEMPLATE.format(
+			step=_pitch[0],
+			alter_block="<alter>1</alter>" if len(_pitch) > 1 and _pitch[1] == '#' else "",
+			octave=_key // 12
+		))
+	del _key, _pitch
+	FIRST_MEASURE_ATTRIBUTES_TEMPLATE = "<attributes><divisions>{divisions}</divisions><key><fifths>0</fifths></key><time><beats>{beats}</beats><beat-type>{beat_type}</beat-type></time><clef><sign>{clef_sign}</sign><line>{clef_line}</line></clef></attributes>"
+	MEASURE_REST_TEMPLATE = '<note><rest measure="yes" /><duration>{duration}</duration></note>'
 	
 	def __init__(self):
 		logging.basicConfig(level=logging.DEBUG)
 
+		# maps every possible gap size within a measure to the sequence of rest
+		# types that fills it - built by build_rest_plan() once the measure
+		# length for a file is known
+		self.rest_plan = None
+
+		# rests of the same type are identical elements, so keep one prototype
+		# per type and hand out deep copies instead of re-parsing the template
+		self.rest_cache = {}
+
+		# likewise for the whole-measure rest note - its duration depends on
+		# the time signature, so the prototype is reset per input file
+		self.measure_rest_note = None
+
+	def build_rest_plan(self):
+		"""Precompute the rests needed for every possible gap size within a measure
+
+		 Fills self.rest_plan so that self.rest_plan[size] is the list of rest types
+		 (smallest first) that exactly fills a gap of the given length. This turns the
+		 divmod chain in get_rests() plus the nested emission loop into a single list
+		 lookup per gap in the note loop.
+
+		 Should be (re)built whenever LMMS_MEASURE_LENGTH changes, i.e. per input file.
+
+		"""
+		self.rest_plan = []
+		for size in range(self.LMMS_MEASURE_LENGTH + 1):
+			rests_to_add = self.get_rests(size)
+			plan = []
+			for rest in rests_to_add:
+				for l in range(0, rests_to_add[rest]):
+					plan.append(rest)
+			self.rest_plan.append(plan)
+
+	def add_rests_for_gap(self, parent_node, size):
+		"""Add the sequence of rests that fills a gap of the given length
+
+		 Arguments:
+			- parent_node (ElementTree element node): the measure to add the rests to
+			- size (int): the length of the gap to fill (gaps <= 0 add nothing)
+
+		"""
+		if size <= 0:
+			return
+
+		if self.rest_plan == None:
+			self.build_rest_plan()
+
+		# gaps are normally within a single measure, but if one spans further,
+		# emit the whole-rest prefix first and look up the remainder
+		while size > self.LMMS_MEASURE_LENGTH:
+			self.add_rest(parent_node, "whole")
+			size -= self.LMMS_MEASURE_LENGTH
+
+		for rest in self.rest_plan[size]:
+			self.add_rest(parent_node, rest)
+
 	def find_closest_note_type(self, length):
 		"""For a given length, find the closest note type (i.e. half, whole, quarter)
 		
@@ -144,69 +252,65 @@ class MMP_MusicXML_Converter:
 		 Returns a string indicating the closest note length
 		 
 		"""
-		closest_length = None
-		
-		for note_length in sorted(self.NOTE_LENGTHS, reverse=True):
-			if note_length <= length:
-				return self.NOTE_LENGTHS[note_length]
-					
-		if closest_length == None:
-			return self.NOTE_LENGTHS[3]
-
-	def add_note(self, parent_node, note, is_chord=False, length_table=None):
+		if length > self.MAX_NOTE_LENGTH:
+			# a length longer than a whole note is still a whole note
+			length = self.MAX_NOTE_LENGTH
+
+		return self.LENGTH_TO_TYPE[length]
+
+	def add_note(self, parent_node, key, position, length, is_chord=False, length_table=None):
 		"""Add a new note
-		
+
 		 Can specify if adding a new note to a chord (which appends a chord element)
 		 Can also supply a lengthTable, which maps the note positions to the smallest-length-note at each position
-		 
+
 		 Arguments:
-			- parent_node (ElementTree element node): the parent node that the note should be added to 
-			- note (ElementTree element node): a node representing a note given by the mmp file
-			- is_chord (bool): specify if this note is part of a chord 
+			- parent_node (ElementTree element node): the parent node that the note should be added to
+			- key (int): the note's piano key number from the mmp file
+			- position (int): the note's absolute position
+			- length (int): the note's length
+			- is_chord (bool): specify if this note is part of a chord
 			- length_table (dict)
-			
+
 		 Returns a reference to the element node representing the note
-		 
+
 		"""
-		pitch = self.NOTES[int(note.attrib["key"]) % 12]
-		position = int(note.attrib["pos"])
-		new_note = ET.SubElement(parent_node, "note")
-		
-		# if note belongs to chord 
-		if is_chord:
-			new_chord = ET.SubElement(new_note, "chord")
-		
-		new_pitch = ET.SubElement(new_note, "pitch")
-		new_step = ET.SubElement(new_pitch, "step")
-		new_step.text = str(pitch[0])
-		
-		if len(pitch) > 1 and pitch[1] == '#':
-			new_alter = ET.SubElement(new_pitch, "alter")
-			new_alter.text = "1"
-		
-		# calculate octave 
-		octave = int(int(note.attrib["key"]) / 12) # basically floor(piano key number / 12)
-		new_octave = ET.SubElement(new_pitch, "octave")
-		new_octave.text = str(octave)
-		
-		# do some math to get the duration given length of note 
-		note_length = int(note.attrib["len"])
+		if 0 <= key < 128:
+			pitch_block = self.PITCH_BLOCK[key]
+		else:
+			# a big master pitch shift can push a key out of piano range -
+			# build the block the slow way for those
+			pitch = self.NOTES[key % 12]
+			pitch_block = self.PITCH_TEMPLATE.format(
+				step=pitch[0],
+				alter_block="<alter>1</alter>" if len(pitch) > 1 and pitch[1] == '#' else "",
+				octave=int(key / 12) # basically floor(piano key number / 12)
+			)
+
+		# do some math to get the duration given length of note
+		note_length = length
 
 		if length_table != None:
 			# when would it be None?
 			# note that the note length is actually the corrected length
 			# this is because I'm not handling dotted notes right now so that if you use the actual length given by LMMS,
-			# you're going to skip out on some rests and throw everything off 
-			# instead take the note's original length but use NOTE_TYPE to get the corrected length
-			note_length = self.NOTE_TYPE[self.find_closest_note_type(length_table[position])]
-		
-		new_duration = ET.SubElement(new_note, "duration")
-		new_duration.text = str(int(note_length/6))
-		
-		# need to identify the note type 
-		new_type = ET.SubElement(new_note, "type")
-		new_type.text = self.find_closest_note_type(note_length)
-		
+			# you're going to skip out on some rests and throw everything off
+			# instead take the note's original length but use the lookup tables to get the corrected type and duration
+			corrected_length = min(length_table[position], self.MAX_NOTE_LENGTH)
+			note_type = self.LENGTH_TO_TYPE[corrected_length]
+			duration = self.LENGTH_TO_DURATION[corrected_length]
+		else:
+			note_type = self.find_closest_note_type(note_length)
+			duration = str(int(note_length/6))
+
+		new_note = ET.fromstring(self.NOTE_TEMPLATE.format(
+			chord_block="<chord />" if is_chord else "",
+			pitch_block=pitch_block,
+			duration=duration,
+			type=note_type
+		))
+		parent_node.append(new_note)
+
 		return new_note
 
 	def add_rest(self, parent_node, type):
@@ -221,33 +325,33 @@ class MMP_MusicXML_Converter:
 		 Returns a reference to the element node representing the rest 
 		 
 		"""
-		# you will need to figure out the duration given the type! i.e. 16th = duration of 2 if divisions is 8 
-		# so if divisions = 8, then the smallest unit is 32nd notes, since 8 32nd notes go into 1 quarter note 
-		new_note = ET.SubElement(parent_node, "note")
-		new_rest = ET.SubElement(new_note, "rest")
-		new_duration = ET.SubElement(new_note, "duration")
-		
-		# calculate the correct duration text depending on type 
-		# note that this also depends on divisions!
-		# assuming division = 8 here!
-		# a duration of 1 = 1 32nd note
-		dur = ""
-		if type == "32nd":
-			dur = "1"
-		elif type == "16th":
-			dur = "2" # 2 32nd notes = 1 16th note 
-		elif type == "eighth":
-			dur = "4"
-		elif type == "quarter":
-			dur = "8"
-		elif type == "half":
-			dur = "16"
-			
-		new_duration.text = dur
-		
-		new_type = ET.SubElement(new_note, "type")
-		new_type.text = type
-		return new_note 
+		prototype = self.rest_cache.get(type)
+
+		if prototype == None:
+			# you will need to figure out the duration given the type! i.e. 16th = duration of 2 if divisions is 8
+			# so if divisions = 8, then the smallest unit is 32nd notes, since 8 32nd notes go into 1 quarter note
+			# calculate the correct duration text depending on type
+			# note that this also depends on divisions!
+			# assuming division = 8 here!
+			# a duration of 1 = 1 32nd note
+			dur = ""
+			if type == "32nd":
+				dur = "1"
+			elif type == "16th":
+				dur = "2" # 2 32nd notes = 1 16th note
+			elif type == "eighth":
+				dur = "4"
+			elif type == "quarter":
+				dur = "8"
+			elif type == "half":
+				dur = "16"
+
+			prototype = ET.fromstring(self.REST_TEMPLATE.format(duration=dur, type=type))
+			self.rest_cache[type] = prototype
+
+		new_note = copy.deepcopy(prototype)
+		parent_node.append(new_note)
+		return new_note
 
 	def get_rests(self, initial_distance):
 		"""Figure out types and number of rests needed given a length from one note to another 
@@ -323,43 +427,27 @@ class MMP_MusicXML_Converter:
 		 
 		"""
 		first_measure = self.create_measure(parent_node, measure_counter)
-		new_measure_attributes = ET.SubElement(first_measure, "attributes")
-		
+
 		# for the first measure, we need to indicate divisions, clef, key
 		# for divisions, this is how much a quarter note will be subdivided
-		# so if you have only eighth notes as the smallest unit in your piece, 
-		# use 2 if 16th is the smallest, use 4, etc. 
-		# how to know this programatically though? iterate through all notes just to 
+		# so if you have only eighth notes as the smallest unit in your piece,
+		# use 2 if 16th is the smallest, use 4, etc.
+		# how to know this programatically though? iterate through all notes just to
 		# see first??? just go with 8 for now (so 32nd notes are the smallest unit)
-		divisions = ET.SubElement(new_measure_attributes, "divisions")
-		divisions.text = self.NUM_DIVISIONS
-		
-		key = ET.SubElement(new_measure_attributes, "key")
-		fifths = ET.SubElement(key, "fifths")
-		fifths.text = "0"
-		
-		time = ET.SubElement(new_measure_attributes, "time")
-		time_beats = ET.SubElement(time, "beats")
-		time_beats.text = self.TIME_SIGNATURE_NUMERATOR
-		time_beat_type = ET.SubElement(time, "beat-type")
-		time_beat_type.text = self.TIME_SIGNATURE_DENOMINATOR 
-
-		# this needs to be changed depending on instrument!!
-		new_clef = ET.SubElement(new_measure_attributes, "clef")
-		clef_sign = ET.SubElement(new_clef, "sign")
-		clef_sign.text = self.CLEF_TYPE[clef_type]["sign"] 
-		clef_line = ET.SubElement(new_clef, "line")
-		clef_line.text = self.CLEF_TYPE[clef_type]["line"]
-		
+		# the clef needs to be changed depending on instrument!!
+		first_measure.append(ET.fromstring(self.FIRST_MEASURE_ATTRIBUTES_TEMPLATE.format(
+			divisions=self.NUM_DIVISIONS,
+			beats=self.TIME_SIGNATURE_NUMERATOR,
+			beat_type=self.TIME_SIGNATURE_DENOMINATOR,
+			clef_sign=self.CLEF_TYPE[clef_type]["sign"],
+			clef_line=self.CLEF_TYPE[clef_type]["line"]
+		)))
+
 		if is_rest:
-			new_note = ET.SubElement(first_measure, "note")
-			new_rest = ET.SubElement(new_note, "rest")
-			new_rest.set("measure", "yes")
-			new_duration = ET.SubElement(new_note, "duration")
-			new_duration.text = str(int(self.TIME_SIGNATURE_NUMERATOR) * int(self.NUM_DIVISIONS))
-			
-		return first_measure 
-		
+			first_measure.append(self.get_measure_rest_note())
+
+		return first_measure
+
 	def add_rest_measure(self, parent_node, measure_counter):
 		"""Add a complete measure of rest 
 		
@@ -370,20 +458,31 @@ class MMP_MusicXML_Converter:
 		 Returns a reference to a newly created measure node
 		 
 		"""
-		new_rest_measure = ET.SubElement(parent_node, "measure")
-		new_rest_measure.set("number", str(measure_counter))
-		
-		# make sure to add rest element in 'note' section 
-		new_note = ET.SubElement(new_rest_measure, "note")
-		new_rest = ET.SubElement(new_note, "rest")
-		new_rest.set("measure", "yes")
-		new_duration = ET.SubElement(new_note, "duration")
-		
-		# should be beats * duration - here is 32 because 4 beats, each beat has 8 subdivisions 
-		new_duration.text = str(int(self.TIME_SIGNATURE_NUMERATOR) * int(self.NUM_DIVISIONS))
+		new_rest_measure = self.create_measure(parent_node, measure_counter)
+
+		# make sure to add rest element in 'note' section
+		new_rest_measure.append(self.get_measure_rest_note())
 
 		return new_rest_measure
 
+	def get_measure_rest_note(self):
+		"""Get a fresh copy of the note element representing a whole-measure rest
+
+		 Rest measures only differ in their measure number, so the inner note is
+		 built once per input file (its duration depends on the time signature -
+		 beats * divisions, e.g. 32 for 4 beats of 8 subdivisions each) and
+		 deep-copied for every rest measure after that.
+
+		 Returns an ElementTree element node
+
+		"""
+		if self.measure_rest_note == None:
+			self.measure_rest_note = ET.fromstring(self.MEASURE_REST_TEMPLATE.format(
+				duration=int(self.TIME_SIGNATURE_NUMERATOR) * int(self.NUM_DIVISIONS)
+			))
+
+		return copy.deepcopy(self.measure_rest_note)
+
 	def new_measure_check(self, curr_length):
 		"""Checks if a new measure should be added given the current length of notes in a measure so far.
 		
@@ -405,32 +504,32 @@ class MMP_MusicXML_Converter:
 			- parent_node (ElementTree element node): the node to add the new measure to 
 			- measure_num (int): the new measure's number 
 		  
-		 Returns an ElementTree element node representing the new measure added 
-		  
+		 Returns an ElementTree element node representing the new measure added
+
 		"""
-		curr_measure = ET.SubElement(parent_node, "measure")
-		curr_measure.set("number", str(measure_num))
-		return curr_measure 
+		return self.create_measure(parent_node, measure_num)
+
+	def create_length_table(self, note_positions, note_lengths, note_measures):
+		"""Creates a dictionary mapping note positions in the LMMS .mmp file to what their lengths should be in the MusicXML file
 
-	def create_length_table(self, notes):
-		"""Creates a dictionary mapping note positions in the LMMS .mmp file to what their lengths should be in the MusicXML file  
-		
 		 Arguments:
-			- notes (list): list of ElementTree element nodes representing notes
-		
+			- note_positions (list): absolute note positions as ints, sorted ascending
+			- note_lengths (list): note lengths as ints, parallel to note_positions
+			- note_measures (list): 1-based measure numbers as ints, parallel to note_positions
+
 		 Returns a dictionary
-		 
+
 		"""
-		length_table = {} 
-		
+		length_table = {}
+
 		# also truncate some lengths as needed if they carry over to the next measure?
 		# example: look at the 2nd-to-last and last notes. 372 + 48 > 384, but 384 is the next measure.
-		# so therefore if we didn't have any other notes at that position except the one with length 48, 
+		# so therefore if we didn't have any other notes at that position except the one with length 48,
 		# the 2nd-to-last note's length should be truncated to 12, the smallest length at that position
 		# that does not carry over to the next measure.
 		#
 		#  <note pan="0" key="67" vol="48" pos="372" len="48"/>
-		#  <note pan="0" key="77" vol="48" pos="384" len="48"/> 
+		#  <note pan="0" key="77" vol="48" pos="384" len="48"/>
 		#
 		# we also have to truncate notes within the same measure
 		# example: the 2nd note below happens before the 1st note ends.
@@ -440,61 +539,72 @@ class MMP_MusicXML_Converter:
 		#  <note pan="0" key="62" vol="87" pos="264" len="96"/>
 		#
 		# this scenario also:
-		# the note at post 144 becomes a half note and makes the current measure too large by a quarter note 
+		# the note at post 144 becomes a half note and makes the current measure too large by a quarter note
 		# pos: 144, len: 240, measure: 1
 		# pos: 240, len: 144, measure: 2
-		# this scenario is remedied by only updating the length table if a new smaller length is found for a position already in the table 
-		
-		next_measure_pos = self.LMMS_MEASURE_LENGTH
-		for i in range(0, len(notes)):
-			note = notes[i][0]
-			position = int(note.attrib["pos"])
-			length = int(note.attrib["len"])
-			
-			if position in length_table:
-			
-				if length < length_table[position]:
-					length_table[position] = length
-				
-				# there might be an instance where we have at least 2 notes in the same position,
-				# but they're the same length AND they should actually be truncated because they
-				# spill over into another note like in the second if statement below (in the else block) 
-				# so we need to check that here 
-				if i < len(notes)-1 and ((length + position) > int(notes[i+1][0].attrib["pos"])) and position != int(notes[i+1][0].attrib["pos"]):
-					next_note_pos = int(notes[i+1][0].attrib["pos"])
-					
-					# but the new length must be smaller in order to be updated 
-					if next_note_pos - position < length_table[position]:
-						length_table[position] = next_note_pos - position 
-			else:
-				curr_measure_pos = (notes[i][1] - 1) * self.LMMS_MEASURE_LENGTH # notes[i][1]-1 is the measure number 
-				next_measure_pos = curr_measure_pos + self.LMMS_MEASURE_LENGTH
-				
-				# we want to know if this current note carries over into the next measure 
-				# to find out we can see if the current note's position plus its length 
-				# is greater than the next measure's position (i.e. this note spills over into the next measure)
-				curr_note_distance = position + length 
-
-				if curr_note_distance > next_measure_pos:
-					# truncate the note so that its length it goes only up to the next measure's position 
-					length = next_measure_pos - position
-				
-				if i < len(notes)-1:
-					prev_note_pos = int(notes[i+1][0].attrib["pos"])
-					if ((length + position) > prev_note_pos) and position != prev_note_pos:
-						# similar to above, but checking if current note's length overlaps with the next note's position. 
-						# if the current note ends after the next note starts, truncate the current note's length
-						# the new length will be the difference between the next note's position and the current note's position
-						# it's also important to check that this current note is not in the same position as the next note (which forms a chord)
-						# we need this check because otherwise we might get a 0 for l's value 
-						next_note_pos = int(notes[i+1][0].attrib["pos"])
-						length = next_note_pos - position 
-						#logging.debug(str(l) + ", l+p: " + str(l+p) )
-
+		# this scenario is remedied by only keeping the smallest truncated length found for each position
+
+		# the notes are already sorted by position, so do a reverse sweep first to find,
+		# for each note, the position of the nearest following note at a *different* position.
+		# the old version only peeked at notes[i+1], which missed the next distinct position
+		# whenever several notes were stacked at the same position (a chord cluster).
+		num_notes = len(note_positions)
+		next_distinct_pos = [None] * num_notes
+		next_pos = None
+		prev_pos = None
+		for i in range(num_notes - 1, -1, -1):
+			position = note_positions[i]
+			if prev_pos != None and prev_pos != position:
+				next_pos = prev_pos
+			next_distinct_pos[i] = next_pos
+			prev_pos = position
+
+		# then a single forward sweep: each note's length is clamped to whichever comes
+		# first - the next measure boundary or the next distinct note position - and
+		# each position keeps the smallest length seen for it
+		for i in range(0, num_notes):
+			position = note_positions[i]
+			length = note_lengths[i]
+
+			# truncate the note so its length goes only up to the next measure's position
+			# (the measure number is 1-based, so the next measure starts at measure number * measure length)
+			next_measure_pos = note_measures[i] * self.LMMS_MEASURE_LENGTH
+			if position + length > next_measure_pos:
+				length = next_measure_pos - position
+
+			# likewise truncate if this note ends after the next distinct note starts
+			# (notes at the same position form a chord and shouldn't truncate each other,
+			# which is why the next *distinct* position is used - otherwise we might get 0 for the length)
+			if next_distinct_pos[i] != None and position + length > next_distinct_pos[i]:
+				length = next_distinct_pos[i] - position
+
+			if position not in length_table or length < length_table[position]:
 				length_table[position] = length
 				#logging.debug(lengthTable)
-				
-		return length_table 
+
+		return length_table
+
+	def write_score_child(self, file_handle, node):
+		"""Pretty-print one top-level child of score-partwise straight to the output file
+
+		 Arguments:
+			- file_handle: a writable text file handle
+			- node (ElementTree element node): a direct child of score-partwise
+			  (i.e. the movement-title, the part-list, or one part)
+
+		 The node is indented as if it sat one level deep in the document, so
+		 streaming each child out individually produces the same output as
+		 indenting and serializing the whole score-partwise tree at once.
+
+		"""
+		if LET is not None:
+			# hand the node to lxml so the pretty-printing happens in C code
+			lxml_node = LET.fromstring(ET.tostring(node, encoding="utf-8"))
+			LET.indent(lxml_node, space="    ", level=1)
+			file_handle.write("    " + LET.tostring(lxml_node, encoding="unicode") + "\n")
+		else:
+			ET.indent(node, space="    ", level=1)
+			file_handle.write("    " + ET.tostring(node, encoding="unicode") + "\n")
 
 	def convert_file(self, filepath):
 		"""Does the converting from .mmp to MusicXML.
@@ -510,259 +620,266 @@ class MMP_MusicXML_Converter:
 		extensionIndex = file.rfind(".mmp")
 		outputFileName = file[(lastSlashIndex + 1):extensionIndex]
 			
-		tree = ET.parse(file)
-		root = tree.getroot()
-
-		# get the time signature of the piece 
-		self.TIME_SIGNATURE_NUMERATOR = str(root.find('head').attrib['timesig_numerator'])
-		self.TIME_SIGNATURE_DENOMINATOR = str(root.find('head').attrib['timesig_denominator'])
-
-		# get the master pitch. if it's not 0, we can alter the notes accordingly. 
-		MASTER_PITCH = int(root.find('head').attrib['masterpitch'])
+		# parse the mmp incrementally, SAX-style: pull out only plain data -
+		# the head attributes plus, for each instrument track, its name and the
+		# (pattern position, [(key, pos, len), ...]) int tuples of its notes.
+		# every element is cleared as soon as its track's end tag is seen, so no
+		# part of the input DOM outlives this loop (automation tracks, fx
+		# chains, etc. never accumulate at all)
+		head_attributes = None
+		instrument_tracks = []
+		for event, elem in ET.iterparse(file, events=("end",)):
+			if elem.tag == 'head':
+				head_attributes = dict(elem.attrib)
+			elif elem.tag == 'track':
+				if elem.attrib.get('name') in self.INSTRUMENTS:
+					patterns = []
+					for pattern in elem.iter(tag='pattern'):
+						chunk_notes = [(int(n.attrib["key"]), int(n.attrib["pos"]), int(n.attrib["len"])) for n in pattern.iter(tag='note')]
+						patterns.append((int(pattern.attrib["pos"]), chunk_notes))
+					instrument_tracks.append((elem.attrib['name'], patterns))
+				elem.clear()
+
+		# get the time signature of the piece
+		self.TIME_SIGNATURE_NUMERATOR = str(head_attributes['timesig_numerator'])
+		self.TIME_SIGNATURE_DENOMINATOR = str(head_attributes['timesig_denominator'])
+
+		# get the master pitch. if it's not 0, we can alter the notes accordingly.
+		MASTER_PITCH = int(head_attributes['masterpitch'])
 
 		# LMMS measure length variable needs to be based on the time signature numerator 
 		# a quarter note is always length 48 
 		self.LMMS_MEASURE_LENGTH = self.NOTE_TYPE["quarter"] * int(self.TIME_SIGNATURE_NUMERATOR)
-	
+
+		# the rest plan and the measure-rest prototype depend on the time
+		# signature, so rebuild them for this file
+		self.build_rest_plan()
+		self.measure_rest_note = None
+
 		logging.debug(file)
 		logging.debug("LMMS_MEASURE_LENGTH: " + str(self.LMMS_MEASURE_LENGTH))
 		logging.debug("TIME SIGNATURE: " + str(self.TIME_SIGNATURE_NUMERATOR) + "/" + str(self.TIME_SIGNATURE_DENOMINATOR))
 		#logging.debug("Duration of a measure (with 32nd notes): " + str(int(TIME_SIGNATURE_NUMERATOR) * int(NUM_DIVISIONS)))
 			
-		# if we come across an empty instrument (i.e. no notes), put their PART ID (i.e. 'P1') in this list. 
-		# then at the end we look for nodes containing these names and delete them.
-		empty_instruments = []
+		# if we come across an empty instrument (i.e. no notes), put their PART ID (i.e. 'P1') in this set.
+		# then at the end we delete the nodes that were created for these ids.
+		empty_instruments = set()
 
-		# write a new xml file 
+		# write a new xml file
 		new_file = open(outputFileName + ".xml", "w")
 
-		# add the appropriate headers first 
-		new_file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-		new_file.write('<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML 3.1 Partwise//EN" "http://www.musicxml.org/dtds/partwise.dtd">\n')
-
-		# create the general tree structure, then fill in accordingly
-		score_partwise = ET.Element('score-partwise')
+		# instead of one big score-partwise tree, each top-level piece (title,
+		# part-list, then each part) is built separately and streamed out by
+		# write_score_child() so the whole document never sits in memory at once
 
 		# title of piece
-		movement_title = ET.SubElement(score_partwise, 'movement-title')
+		movement_title = ET.Element('movement-title')
 		movement_title.text = "title of piece goes here"
 
-		# list of the instrument parts 
-		part_list = ET.SubElement(score_partwise, 'part-list')
+		# list of the instrument parts
+		part_list = ET.Element('part-list')
 
-		# then go through each instrument in the mmp file and add them to part-list 
+		# then go through each instrument in the mmp file and add them to part-list
+		# also remember each score-part node by its id so the empty-instrument
+		# cleanup at the end doesn't have to scan the part-list for it
+		score_part_by_id = {}
 		instrument_counter = 1
-		for el in tree.iter(tag = 'track'):
-			name = el.attrib['name']
-			if name in self.INSTRUMENTS:
-				new_part = ET.SubElement(part_list, "score-part")
-				new_part.set('id', "P" + str(instrument_counter))
-				instrument_counter += 1
-				
-				new_part_name = ET.SubElement(new_part, "part-name")
-				new_part_name.text = name
+		for name, patterns in instrument_tracks:
+			part_id = "P" + str(instrument_counter)
+			new_part = ET.SubElement(part_list, "score-part")
+			new_part.set('id', part_id)
+			score_part_by_id[part_id] = new_part
+			instrument_counter += 1
 
+			new_part_name = ET.SubElement(new_part, "part-name")
+			new_part_name.text = name
 
-		# now that the instruments have been declared, time to write out the notes for each instrument 
 
-		# the xml file for a LMMS project might not actually have the notes in order for an instrument!!! 
-		# notes in LMMS are separated in chunks called 'patterns' in the XML file (.mmp). each pattern has 
-		# a position, so use that to sort the patterns in order. then write out the notes 
-		instrument_counter = 1 	# reset instrumentCounter 
+		# now that the instruments have been declared, time to write out the notes for each instrument
 
-		# we need to keep track of each part - ther part id node and the last measure num they had notes for. 
-		# at the very end we need to make sure every part has the same number of measures 
-		part_measures = {}
+		# the xml file for a LMMS project might not actually have the notes in order for an instrument!!!
+		# notes in LMMS are separated in chunks called 'patterns' in the XML file (.mmp). each pattern has
+		# a position, so use that to sort the patterns in order. then write out the notes
+		instrument_counter = 1 	# reset instrumentCounter
 
-		# for each track element
-		for el in tree.iter(tag = 'track'):
+		# we need to keep track of each part - ther part id node and the last measure num they had notes for.
+		# at the very end we need to make sure every part has the same number of measures
+		part_measures = {}
 
-			name = el.attrib['name']
-			
-			if name in self.INSTRUMENTS:
-				
-				# for each valid instrument el, create a new part section that will hold its measures and their notes
-				current_part = ET.SubElement(score_partwise, "part");
-				current_part.set("id", "P" + str(instrument_counter))
-				
-				# get the pattern chunks (which hold the notes)
-				pattern_chunks = []
-				for el2 in el.iter(tag = 'pattern'):
-					pattern_chunks.append(el2)
-				
-				curr_measure = None
-				pattern_notes = []
-				
-				# concatenate all the patterns and get their notes all in one list 
-				for i in range(0, len(pattern_chunks)):
-					# get the position of the pattern. note that a pattern might not start at position 0!
-					# if it doesn't start at 0 and it's the first pattern, or the current chunk doesn't start
-					# where the previous chunk left off, then you need to make rest measures to fill in any gaps. 
-					# another LMMS xml file property -> every measure is of length (time signature numerator * 48), so each measure's position 
-					# is a multiple of that product 
-					chunk = pattern_chunks[i].iter(tag = 'note')
-					chunk_pos = int(pattern_chunks[i].attrib["pos"])
-					measure_num = int(chunk_pos/self.LMMS_MEASURE_LENGTH) + 1 # patterns always start on a multiple of 192 
-					
-					for n in chunk:
-						# because each note's position is relative to their pattern, each note's position should be their pattern pos + note pos 
-						# but an important piece of information is what measure this note falls in.
-						# we'll record the measure in a tuple along with a reference to the note, i.e. (noteReference, measureNumber)
-						note_pos = int(n.attrib["pos"])			
-						new_pos = chunk_pos + note_pos 
-						n.set("pos", str(new_pos))
-						
-						# increment measure num if needed
-						if new_pos >= (measure_num*self.LMMS_MEASURE_LENGTH):
-							# if note is within the next measure over 
-							if new_pos < ((measure_num + 1)*self.LMMS_MEASURE_LENGTH):
-								measure_num += 1
-							else:
-								# the newPos might actually be a few measures over, not just the next measure! 
-								# need to add 1 because positions start at 0
-								measure_num = int(math.floor(new_pos / self.LMMS_MEASURE_LENGTH)) + 1
-						
-						pattern_notes.append((n, measure_num))
-							
-				# sort the notes in the list by position
-				# remember that the elements are tuples => (note, the measure note is in)
-				pattern_notes = sorted(pattern_notes, key=lambda p: int(p[0].attrib["pos"]))
-
-				# this is very helpful for checking notes 
-				#if name == 'tuba':
-				#	logging.debug("----- " + str(name) + " ------------------")
-				#	for p in pattern_notes:
-				#		logging.debug("pos: " + str(p[0].attrib["pos"]) + ", len: " + str(p[0].attrib["len"]) + ", measure: " + str(p[1]))
-				#	logging.debug("-----------------------")
-						
-				notes = pattern_notes 
-				
-				# this instrument might not have any notes! (empty track)
-				# if so, need to remove this subelement node at the very end otherwise MuseScore will complain... 
-				# (the xml is valid, i.e. it's an empty tag but MuseScore doesn't like that)
-				if len(notes) == 0:
-					empty_instruments.append("P" + str(instrument_counter))
-					continue
-					
-				# find out what the smallest note length should be for stacked notes in a chord
-				# this unfortunately means tied notes will be broken
-				position_lengths = self.create_length_table(notes)
+		# the finished part nodes, in the order they should appear in the document
+		parts = []
+
+		# for each instrument track
+		for name, patterns in instrument_tracks:
+
+			# for each valid instrument, create a new part section that will hold its measures and their notes
+			current_part = ET.Element("part")
+			current_part.set("id", "P" + str(instrument_counter))
+			parts.append(current_part)
+
+			curr_measure = None
+			pattern_notes = []
+
+			# concatenate all the patterns and get their notes all in one list
+			for chunk_pos, chunk_notes in patterns:
+				# note that a pattern might not start at position 0!
+				# if it doesn't start at 0 and it's the first pattern, or the current chunk doesn't start
+				# where the previous chunk left off, then you need to make rest measures to fill in any gaps.
+				# another LMMS xml file property -> every measure is of length (time signature numerator * 48), so each measure's position
+				# is a multiple of that product
+
+				for note_key, note_pos, note_len in chunk_notes:
+					# because each note's position is relative to their pattern, each note's position should be their pattern pos + note pos
+					# but an important piece of information is what measure this note falls in.
+					# positions start at 0, so the measure number is just the floor division plus 1
+					# record everything as a tuple of plain ints => (key, measureNumber, position, length)
+					# the master pitch adjustment is also folded in at this point
+					new_pos = chunk_pos + note_pos
+					measure_num = new_pos // self.LMMS_MEASURE_LENGTH + 1
+
+					pattern_notes.append((note_key + MASTER_PITCH, measure_num, new_pos, note_len))
+
+			# sort the notes in the list by position (tuple slot 2)
+			# the position was already parsed to an int above, so sort on that
+			# instead of re-parsing the attribute for every comparison -
+			# itemgetter keeps the key extraction in C instead of calling a
+			# Python lambda once per element
+			pattern_notes.sort(key=itemgetter(2))
+
+			# this is very helpful for checking notes
+			#if name == 'tuba':
+			#	logging.debug("----- " + str(name) + " ------------------")
+			#	for p in pattern_notes:
+			#		logging.debug("key: " + str(p[0]) + ", pos: " + str(p[2]) + ", len: " + str(p[3]) + ", measure: " + str(p[1]))
+			#	logging.debug("-----------------------")
+
+			# this instrument might not have any notes! (empty track)
+			# if so, need to remove this subelement node at the very end otherwise MuseScore will complain...
+			# (the xml is valid, i.e. it's an empty tag but MuseScore doesn't like that)
+			if len(pattern_notes) == 0:
+				empty_instruments.add("P" + str(instrument_counter))
+				continue
+
+			# unpack the sorted tuples into parallel columns so the hot loops below
+			# index plain ints instead of going back to each note's attribute dict
+			note_keys = [p[0] for p in pattern_notes]
+			note_measures = [p[1] for p in pattern_notes]
+			note_positions = [p[2] for p in pattern_notes]
+			note_lengths = [p[3] for p in pattern_notes]
+			num_notes = len(pattern_notes)
+
+			# find out what the smallest note length should be for stacked notes in a chord
+			# this unfortunately means tied notes will be broken
+			position_lengths = self.create_length_table(note_positions, note_lengths, note_measures)
+
+			# the emission loop below keeps asking for the corrected length at a
+			# position (the table length snapped to its closest note type), so
+			# derive that once per position here instead of re-deriving it for
+			# every rest gap, measure padding, and note
+			corrected_lengths = {p: self.NOTE_TYPE[self.LENGTH_TO_TYPE[min(l, self.MAX_NOTE_LENGTH)]] for p, l in position_lengths.items()}
+
+			# first create the first measure for this intrument. it might be a rest measure,
+			# or rest measures might need to be added first!
+			first_note_measure_num = note_measures[0]
+
+			if first_note_measure_num == 1:
+				# if first note starts from the very beginning, create initial measure without any rests padding
+				if name in self.BASS_INSTRUMENTS:
+					curr_measure = self.create_first_measure(current_part, first_note_measure_num, "bass", False)
+				else:
+					curr_measure = self.create_first_measure(current_part, first_note_measure_num, "treble", False)
+			else:			
+				# add whole rests first 
+				num_whole_rests = first_note_measure_num - 1
 				
-				# first create the first measure for this intrument. it might be a rest measure, 
-				# or rest measures might need to be added first!
-				first_note_pos = int(notes[0][0].attrib["pos"])
-				first_note_measure_num = notes[0][1]
-
-				if first_note_measure_num == 1:
-					# if first note starts from the very beginning, create initial measure without any rests padding
-					if name in self.BASS_INSTRUMENTS:
-						curr_measure = self.create_first_measure(current_part, first_note_measure_num, "bass", False)
-					else:
-						curr_measure = self.create_first_measure(current_part, first_note_measure_num, "treble", False)
-				else:			
-					# add whole rests first 
-					num_whole_rests = first_note_measure_num - 1
-					
-					for i in range(0, num_whole_rests):
-						if i == 0:
-							if name in self.BASS_INSTRUMENTS:
-								self.create_first_measure(current_part, i + 1, "bass", True)
-							else:
-								self.create_first_measure(current_part, i + 1, "treble", True)
+				for i in range(0, num_whole_rests):
+					if i == 0:
+						if name in self.BASS_INSTRUMENTS:
+							self.create_first_measure(current_part, i + 1, "bass", True)
 						else:
-							self.add_rest_measure(current_part, i + 1)
-					
-					curr_measure = self.add_new_measure(current_part, first_note_measure_num)
-					
-				last_measure_num = first_note_measure_num 
-				
-				# then go through the notes
-				part_measures[current_part] = 0 	# keep track of how many measures this instrument has 
-				positions_seen = set()
-				for k in range(0, len(notes)):
-				
-					note = notes[k][0]
-					note_len = int(notes[k][0].attrib["len"])
-					measure_num = notes[k][1]
-					
-					position = int(note.attrib["pos"])
-					
-					# adjust the note based on master pitch 
-					note.attrib["key"] = str(int(note.attrib["key"]) + MASTER_PITCH)
-					
-					# since the notes list contains tuples where tuple[0] is the note object, 
-					# and tuple[1] is the measure the note should go in, we can use this info 
-					if last_measure_num == measure_num:
-						
-						# add the note (but check to see if it belongs to a chord!)
-						if position in positions_seen:	
-							# this note is part of a chord 
-							self.add_note(curr_measure, note, True, position_lengths)
-						else:
-							# add rests if needed based on previous note's position, then add the note 
-							if k > 0:
-								prev_note_pos = int(notes[k-1][0].attrib["pos"])
-								rests_to_add = self.get_rests(position - (prev_note_pos + self.NOTE_TYPE[self.find_closest_note_type(position_lengths[prev_note_pos])]))
-							else:
-								rests_to_add = self.get_rests(position - ((measure_num - 1)*self.LMMS_MEASURE_LENGTH))
-						
-							for rest in rests_to_add:
-								for l in range(0, rests_to_add[rest]):
-									self.add_rest(curr_measure, rest)
-								
-							positions_seen.add(position)
-							self.add_note(curr_measure, note, False, position_lengths)
-						
-						# pad the rest of the measure with rests if needed (i.e. this is the last note of this measure)
-						if (k < len(notes) - 1 and notes[k+1][1] > measure_num ) or (k == (len(notes) - 1)):
-							size = (measure_num * self.LMMS_MEASURE_LENGTH) - (position + self.NOTE_TYPE[self.find_closest_note_type(position_lengths[position])])
-							pad_rests_to_add = self.get_rests(size)
-							for rest in pad_rests_to_add:
-								for l in range(0, pad_rests_to_add[rest]):
-									self.add_rest(curr_measure, rest)
+							self.create_first_measure(current_part, i + 1, "treble", True)
 					else:
-						# need to create new measure(s), then add the note
-						if k > 0:
-							num_whole_rests = measure_num - last_measure_num - 1
-							for i in range(0, num_whole_rests):
-								self.add_rest_measure(current_part, notes[k-1][1] + i + 1)
-								
-							# create the new measure to place the note 
-							curr_measure = self.add_new_measure(current_part, measure_num)
-							
-							# add the note (but check to see if it belongs to a chord!)
-							if position in positions_seen:	
-								# make new note but add to a chord
-								# no need to check if need to make a new measure because these notes are in a chord 
-								self.add_note(curr_measure, note, True, position_lengths)
-							else:
-								# this might be reached when adding the first note of a new measure 
-								rests_to_add = self.get_rests(position - ((measure_num - 1)*self.LMMS_MEASURE_LENGTH))
-							
-								for rest in rests_to_add:
-									# add rests smaller than whole rests 
-									for l in range(0, rests_to_add[rest]):
-										self.add_rest(curr_measure, rest)
-										
-								# then add the note 
-								positions_seen.add(position)
-								self.add_note(curr_measure, note, False, position_lengths)
-								#logging.debug(str(restsToAdd))
-								#logging.debug(positionLengths)
-							
-							# pad the rest of the measure with rests if needed (i.e. this is the last note of this measure)
-							# scenarios that could trigger this condition: one measure with a single note 
-							if (k < len(notes) - 1 and notes[k+1][1] > measure_num ) or (k == (len(notes) - 1)):
-								pad_rests_to_add = self.get_rests((measure_num * self.LMMS_MEASURE_LENGTH) - (position + self.NOTE_TYPE[self.find_closest_note_type(position_lengths[position])]))
-								for rest in pad_rests_to_add:
-									for l in range(0, pad_rests_to_add[rest]):
-										self.add_rest(curr_measure, rest)
-					
-					part_measures[current_part] = measure_num
-					last_measure_num = measure_num
+						self.add_rest_measure(current_part, i + 1)
 				
-				instrument_counter += 1
+				curr_measure = self.add_new_measure(current_part, first_note_measure_num)
 				
+			last_measure_num = first_note_measure_num 
+			
+			# bind the hot helpers and the measure length to locals before the
+			# per-note loop - the closest pure-Python equivalent of compiling the
+			# loop, since it removes the repeated self.* attribute lookups that
+			# otherwise happen several times per note
+			add_note = self.add_note
+			add_rests_for_gap = self.add_rests_for_gap
+			add_rest_measure = self.add_rest_measure
+			add_new_measure = self.add_new_measure
+			measure_length = self.LMMS_MEASURE_LENGTH
+
+			# the measure's start/end positions and the previous note's position
+			# only change when their source values do, so carry them across
+			# iterations as locals instead of recomputing them for every note
+			measure_end = last_measure_num * measure_length
+			measure_start = measure_end - measure_length
+			prev_position = None
+
+			# then go through the notes
+			for k in range(0, num_notes):
+
+				key = note_keys[k]
+				note_len = note_lengths[k]
+				measure_num = note_measures[k]
+				position = note_positions[k]
+
+				# the notes are sorted by position, so the notes of a chord are always
+				# contiguous - this note is a chord member exactly when it shares its
+				# position with the note before it (no need to track a set of seen positions)
+				is_chord = position == prev_position
+
+				# the parallel columns give us the key, measure, position and length
+				# for each note as plain ints, so we can use this info directly.
+				# each note goes through the same four steps, whether or not it
+				# starts a new measure:
+
+				# (1) advance to this note's measure, inserting whole rest measures as needed
+				# (the first note can never get here since last_measure_num starts at its measure)
+				if measure_num != last_measure_num:
+					num_whole_rests = measure_num - last_measure_num - 1
+					for i in range(0, num_whole_rests):
+						add_rest_measure(current_part, note_measures[k-1] + i + 1)
+
+					# create the new measure to place the note
+					curr_measure = add_new_measure(current_part, measure_num)
+					measure_end = measure_num * measure_length
+					measure_start = measure_end - measure_length
+
+				# (2) add any leading rests, then the note itself (a chord member
+				# shares its position with the previous note, so it needs no rests)
+				if is_chord:
+					add_note(curr_measure, key, position, note_len, True, corrected_lengths)
+				else:
+					if measure_num == last_measure_num and k > 0:
+						# gap from the previous note in the same measure
+						add_rests_for_gap(curr_measure, position - (prev_position + corrected_lengths[prev_position]))
+					else:
+						# first note of the part or of a fresh measure - gap from the measure start
+						add_rests_for_gap(curr_measure, position - measure_start)
+
+					add_note(curr_measure, key, position, note_len, False, corrected_lengths)
+					#logging.debug(positionLengths)
+
+				# (3) pad the rest of the measure with rests if needed (i.e. this is the last note of this measure)
+				if (k < num_notes - 1 and note_measures[k+1] > measure_num ) or (k == (num_notes - 1)):
+					add_rests_for_gap(curr_measure, measure_end - (position + corrected_lengths[position]))
+
+				# (4) remember where this note left off
+				last_measure_num = measure_num
+				prev_position = position
+
+			# keep track of how many measures this instrument has
+			part_measures[current_part] = last_measure_num
+			
+			instrument_counter += 1
+			
 		# still need to add whole rests to the end of each instrument so they all have the same number of measures total, 
 		# otherwise a corrupt file will be reported (but it will still work, at least in MuseScore)!
 		highest_num_measures = 0
@@ -775,20 +892,31 @@ class MMP_MusicXML_Converter:
 				for i in range(part_measures[part] + 1, highest_num_measures + 1):
 					self.add_rest_measure(part, i)
 				
-		# check if we need to remove any nodes for empty instruments 
-		for part_id in empty_instruments:
-			for part in score_partwise.findall("part"):
-				if part.attrib['id'] == part_id:
-					score_partwise.remove(part)
-					
-			# remove from part list 
-			for part in part_list.findall('score-part'):
-				if part.attrib['id'] == part_id:
-					part_list.remove(part)
-					
-
-		# write tree to file 
-		# make sure to pretty-print because otherwise everything will be on one line
-		data = minidom.parseString(ET.tostring(score_partwise, encoding="unicode")).toprettyxml(indent="    ")
-		data = data.replace("<?xml version=\"1.0\" ?>", "") # toprettyxml adds a xml declaration, but I have it already written to the file
-		new_file.write(data)
+		# check if we need to remove any nodes for empty instruments
+		if len(empty_instruments) > 0:
+			parts = [part for part in parts if part.attrib['id'] not in empty_instruments]
+
+			# remove from part list - the id lookup avoids rescanning the
+			# part-list's children for every empty instrument
+			for part_id in empty_instruments:
+				part_list.remove(score_part_by_id[part_id])
+
+
+		# stream the document out piece by piece instead of assembling one big
+		# score-partwise tree and serializing it in a single shot - each part is
+		# written (and can be garbage collected) independently
+		# the header never changes, so emit it as one literal write
+		new_file.write(
+			'<?xml version="1.0" encoding="UTF-8"?>\n'
+			'<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML 3.1 Partwise//EN" "http://www.musicxml.org/dtds/partwise.dtd">\n'
+			'<score-partwise>\n'
+		)
+
+		self.write_score_child(new_file, movement_title)
+		self.write_score_child(new_file, part_list)
+
+		while len(parts) > 0:
+			part = parts.pop(0)
+			self.write_score_child(new_file, part)
+
+		new_file.write('</score-partwise>')
@@ -16,11 +16,7 @@ def test_find_closest_note_type():
 def test_add_note():
 	converter = MMP_MusicXML_Converter()
 	parent_node = ET.Element('node')
-	note = ET.Element('note')
-	note.set('len', 192)
-	note.set('key', 53)
-	note.set('pos', 384)
-	converter.add_note(parent_node, note, False, None)
+	converter.add_note(parent_node, 53, 384, 192, False, None)
 	
 	count = 0
 	for child in parent_node: